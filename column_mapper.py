@@ -1,5 +1,25 @@
 # etl/column_mapper.py
 
+# Normalized column name → standard EV schema column
+_COLUMN_MAPPING = {
+    "vehicleid": "VehicleID",
+    "brand": "Manufacturer",
+    "manufacturer": "Manufacturer",
+    "model": "Model",
+    "segment": "Segment",
+    "battery": "BatterykWh",
+    "battery_size": "BatterykWh",
+    "range": "Rangekm",
+    "price": "ExShowroomPriceINR",
+    "cost": "OperatingCostINR",
+    "revenue": "RevenueINR",
+    "city": "City",
+    "usage": "UsageType"
+}
+
+# Strips spaces and underscores when normalizing column names
+_NORM_TABLE = str.maketrans("", "", " _")
+
 def map_columns(df):
     """
     Auto-maps any uploaded dataset columns to a standard EV schema.
@@ -8,27 +28,11 @@ def map_columns(df):
         'brand' or 'manufacturer' → 'Manufacturer'
         'battery' or 'battery_size' → 'BatterykWh'
     """
-    mapping = {
-        "vehicleid": "VehicleID",
-        "brand": "Manufacturer",
-        "manufacturer": "Manufacturer",
-        "model": "Model",
-        "segment": "Segment",
-        "battery": "BatterykWh",
-        "battery_size": "BatterykWh",
-        "range": "Rangekm",
-        "price": "ExShowroomPriceINR",
-        "cost": "OperatingCostINR",
-        "revenue": "RevenueINR",
-        "city": "City",
-        "usage": "UsageType"
+    rename_cols = {
+        col: _COLUMN_MAPPING[key]
+        for col in df.columns
+        if (key := col.lower().translate(_NORM_TABLE)) in _COLUMN_MAPPING
     }
 
-    rename_cols = {}
-    for col in df.columns:
-        key = col.lower().replace(" ", "").replace("_", "")
-        if key in mapping:
-            rename_cols[col] = mapping[key]
-
     df.rename(columns=rename_cols, inplace=True)
     return df
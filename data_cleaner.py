@@ -1,23 +1,49 @@
 # etl/data_cleaner.py
+import warnings
+
+import numpy as np
 import pandas as pd
 
+# Dimension columns converted to categorical dtype after cleaning
+CATEGORICAL_COLUMNS = ["Segment", "Manufacturer", "UsageType", "City", "LocationType"]
+
 def clean_data(df):
     """
     Cleans and preprocesses the dataset.
     - Fills missing text fields with 'Unknown'
     - Fills missing numerical fields with median
     - Creates derived metric ProfitINR
+    - Downcasts integer fields and categorizes dimension columns
     """
-    # Fill missing object type columns
-    for col in df.select_dtypes(include="object"):
-        df[col] = df[col].fillna("Unknown")
+    # Fill text columns with 'Unknown' in a single frame-wide pass
+    obj_cols = df.select_dtypes(include="object").columns
+    df.fillna({col: "Unknown" for col in obj_cols}, inplace=True)
 
-    # Fill missing numerical type columns
-    for col in df.select_dtypes(include="number"):
-        df[col] = df[col].fillna(df[col].median())
+    # Fill numerical columns with their median through a masked assignment
+    # on the underlying array (integer columns cannot hold NaN)
+    num_block = df.select_dtypes(include="floating")
+    if num_block.size:
+        arr = num_block.to_numpy(dtype=np.float64, copy=True)
+        with warnings.catch_warnings():
+            # All-empty columns have no median and stay NaN, as with Series.median()
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medians = np.nanmedian(arr, axis=0)
+        mask = np.isnan(arr)
+        arr[mask] = np.broadcast_to(medians, arr.shape)[mask]
+        df[num_block.columns] = arr
 
     # Create ProfitINR if Revenue & OperatingCost exist
     if "RevenueINR" in df.columns and "OperatingCostINR" in df.columns:
-        df["ProfitINR"] = df["RevenueINR"] - df["OperatingCostINR"]
+        df["ProfitINR"] = df["RevenueINR"].to_numpy() - df["OperatingCostINR"].to_numpy()
+
+    # Downcast integer columns to the smallest dtype that holds them; floats
+    # stay float64 since the float32 cast is lossy and the frame is persisted
+    for col in df.select_dtypes(include="int64"):
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+
+    # Store low-cardinality text dimensions as categoricals
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
 
     return df
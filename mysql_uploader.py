@@ -1,20 +1,36 @@
+import functools
+
 import yaml
 from sqlalchemy import create_engine, text
 
-def upload_to_mysql(df):
+# Prefer the libyaml C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+@functools.lru_cache(maxsize=1)
+def _get_db_config():
     with open("config/config.yaml", "r") as f:
-        config = yaml.safe_load(f)
+        return yaml.load(f, Loader=SafeLoader)["database"]
 
-    db = config["database"]
+@functools.lru_cache(maxsize=1)
+def _get_engine():
+    db = _get_db_config()
 
-    engine = create_engine(
-        f"mysql+pymysql://{db['user']}:{db['password']}@{db['host']}/{db['name']}"
+    return create_engine(
+        f"mysql+pymysql://{db['user']}:{db['password']}@{db['host']}/{db['name']}",
+        pool_pre_ping=True,
+        pool_size=4,
+        future=True
     )
 
-    # ✅ STEP 1: DELETE OLD DATA (avoid duplicates)
-    with engine.connect() as conn:
-        conn.execute(text("DELETE FROM ev_data"))
-        conn.commit()
+def upload_to_mysql(df):
+    engine = _get_engine()
+
+    with engine.begin() as conn:
+        # ✅ STEP 1: CLEAR OLD DATA (avoid duplicates)
+        conn.execute(text("TRUNCATE TABLE ev_data"))
 
-    # ✅ STEP 2: INSERT NEW DATA
-    df.to_sql("ev_data", engine, if_exists="append", index=False)
+        # ✅ STEP 2: INSERT NEW DATA (multi-row INSERTs, 2000 rows per statement)
+        df.to_sql("ev_data", conn, if_exists="append", index=False, method="multi", chunksize=2000)
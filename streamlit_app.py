@@ -1,7 +1,12 @@
+import hashlib
+import io
+
+import numpy as np
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
 # Try to import ETL modules, but provide fallback if they don't exist
 try:
@@ -183,6 +188,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------- HELPER FUNCTIONS ----------
+# Row count above which the Battery vs Range scatter is drawn from binned points
+SCATTER_BIN_THRESHOLD = 5000
+
 def process_data(df):
     """Process the uploaded data - handles both ETL and direct processing"""
     
@@ -214,9 +222,79 @@ def process_data(df):
         
         # Clean data
         df = df.dropna(subset=['Segment', 'Manufacturer'])
+
+    # Sorted categoricals let the filters read their options without a scan
+    for col in ['Segment', 'Manufacturer']:
+        df[col] = pd.Categorical(df[col], categories=sorted(df[col].dropna().unique()), ordered=True)
         
     return df
 
+def selection_mask(series, selected):
+    """Boolean row mask for values in selected - matches on the integer codes of a categorical column"""
+    codes = series.cat.categories.get_indexer(selected)
+    return np.isin(series.cat.codes.to_numpy(), codes[codes >= 0])
+
+def drop_unused_categories(frame):
+    """Drop categories with no remaining rows - plotly express looks up a group for every category and fails on empty ones"""
+    cat_cols = frame.select_dtypes(include="category").columns
+    if len(cat_cols) == 0:
+        return frame
+    return frame.assign(**{col: frame[col].cat.remove_unused_categories() for col in cat_cols})
+
+def read_upload(file_bytes, filename):
+    """Parse the uploaded file into a raw DataFrame"""
+    buffer = io.BytesIO(file_bytes)
+    return pd.read_excel(buffer, engine="calamine") if filename.endswith("xlsx") else pd.read_csv(buffer, engine="pyarrow")
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_and_process(data_key, filename, _file_bytes):
+    """Processed DataFrame for the uploaded file - cached per file fingerprint, so reruns skip both the parse and processing
+    without rehashing the file bytes"""
+    return process_data(read_upload(_file_bytes, filename))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def compute_aggregations(data_key, segments, manufacturers, _filtered_df):
+    """Chart aggregations for the current filter selection - cached per dataset and filters"""
+    # Compute all Segment-keyed metrics in a single groupby pass
+    segment_metrics = {'RevenueINR': ('RevenueINR', 'sum')}
+    for col in ('ChargingTimeHours', 'EnergykWh'):
+        if col in _filtered_df.columns:
+            segment_metrics[col] = (col, 'mean')
+    seg_agg = _filtered_df.groupby("Segment", observed=True).agg(**segment_metrics).reset_index()
+
+    aggregations = {
+        'stats': _filtered_df.agg({'RevenueINR': 'sum', 'ProfitINR': 'sum', 'BatterykWh': 'mean', 'Rangekm': 'mean'}),
+        'revenue_by_segment': seg_agg[['Segment', 'RevenueINR']].sort_values('RevenueINR', ascending=False),
+        'top_manufacturers': _filtered_df.groupby("Manufacturer", observed=True)["ProfitINR"].sum().nlargest(10).reset_index(),
+    }
+    if 'UsageType' in _filtered_df.columns:
+        aggregations['usage_data'] = _filtered_df.groupby('UsageType', observed=True).size().reset_index(name='Count')
+    if 'ChargingTimeHours' in seg_agg.columns:
+        aggregations['charging_by_segment'] = seg_agg[['Segment', 'ChargingTimeHours']]
+    if 'EnergykWh' in seg_agg.columns:
+        aggregations['energy_by_segment'] = seg_agg[['Segment', 'EnergykWh']]
+
+    # Large selections are binned to 1-decimal Battery/Range cells per Segment to keep the scatter payload small
+    if len(_filtered_df) > SCATTER_BIN_THRESHOLD:
+        binned = _filtered_df.assign(
+            BatterykWh=_filtered_df['BatterykWh'].round(1),
+            Rangekm=_filtered_df['Rangekm'].round(1)
+        )
+        aggregations['scatter_data'] = binned.groupby(['Segment', 'BatterykWh', 'Rangekm'], observed=True)['RevenueINR'].sum().reset_index()
+
+    # Every frame handed to plotly must only carry categories that have rows
+    return {
+        key: drop_unused_categories(value) if isinstance(value, pd.DataFrame) else value
+        for key, value in aggregations.items()
+    }
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def filtered_csv(data_key, segments, manufacturers, _filtered_df):
+    """UTF-8 CSV export of the current filter selection - cached per dataset and filters"""
+    buffer = io.BytesIO()
+    _filtered_df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
 # ---------- SIDEBAR ----------
 with st.sidebar:
     st.markdown("### 📤 Upload & Filters")
@@ -225,8 +303,7 @@ with st.sidebar:
     st.markdown("---")
     
     st.markdown("### 🎯 Filter Options")
-    segment_filter = st.multiselect("Select Segment", [], key="segment")
-    manufacturer_filter = st.multiselect("Select Manufacturer", [], key="manufacturer")
+    filter_container = st.container()
     
     st.markdown("---")
     
@@ -246,28 +323,36 @@ st.markdown("""
 
 if file:
     try:
-        # Load dataset
-        df = pd.read_excel(file) if file.name.endswith("xlsx") else pd.read_csv(file)
-        
-        # Process data through ETL or direct processing
-        df = process_data(df)
+        # Load dataset and process it through ETL or direct processing (cached per file)
+        file_bytes = file.getvalue()
+        data_key = hashlib.md5(file_bytes).hexdigest()
+        df = load_and_process(data_key, file.name, file_bytes)
 
-        # Update sidebar filters dynamically
-        segment_filter = st.sidebar.multiselect(
+        # Render sidebar filters from the dataset's sorted categories
+        segment_options = df["Segment"].cat.categories.tolist()
+        manufacturer_options = df["Manufacturer"].cat.categories.tolist()
+        segment_filter = filter_container.multiselect(
             "Select Segment", 
-            sorted(df["Segment"].unique()), 
-            default=list(df["Segment"].unique()),
-            key="segment_update"
+            segment_options, 
+            default=segment_options,
+            key="segment"
         )
-        manufacturer_filter = st.sidebar.multiselect(
+        manufacturer_filter = filter_container.multiselect(
             "Select Manufacturer", 
-            sorted(df["Manufacturer"].unique()), 
-            default=list(df["Manufacturer"].unique()),
-            key="manufacturer_update"
+            manufacturer_options, 
+            default=manufacturer_options,
+            key="manufacturer"
         )
 
         # Apply filters
-        filtered_df = df[df["Segment"].isin(segment_filter) & df["Manufacturer"].isin(manufacturer_filter)]
+        if set(segment_filter) == set(segment_options) and set(manufacturer_filter) == set(manufacturer_options):
+            # Everything selected - reuse the full frame instead of copying it
+            filtered_df = df
+        else:
+            filtered_df = drop_unused_categories(
+                df.iloc[selection_mask(df["Segment"], segment_filter) & selection_mask(df["Manufacturer"], manufacturer_filter)]
+            )
+        aggregations = compute_aggregations(data_key, tuple(segment_filter), tuple(manufacturer_filter), filtered_df)
 
         # Upload to MySQL
         if save_db:
@@ -281,6 +366,7 @@ if file:
                 st.sidebar.info("ℹ️ Database module not available. Data saved locally.")
 
         # ---------- METRIC CARDS ----------
+        stats = aggregations['stats']
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
@@ -293,7 +379,7 @@ if file:
             """, unsafe_allow_html=True)
         
         with col2:
-            total_revenue = filtered_df['RevenueINR'].sum()
+            total_revenue = stats['RevenueINR']
             st.markdown(f"""
                 <div class='metric-card'>
                     <div class='metric-icon'>₹</div>
@@ -303,7 +389,7 @@ if file:
             """, unsafe_allow_html=True)
         
         with col3:
-            total_profit = filtered_df['ProfitINR'].sum()
+            total_profit = stats['ProfitINR']
             st.markdown(f"""
                 <div class='metric-card'>
                     <div class='metric-icon'>💰</div>
@@ -313,7 +399,7 @@ if file:
             """, unsafe_allow_html=True)
         
         with col4:
-            avg_battery = filtered_df['BatterykWh'].mean()
+            avg_battery = stats['BatterykWh']
             st.markdown(f"""
                 <div class='metric-card'>
                     <div class='metric-icon'>🔋</div>
@@ -327,8 +413,7 @@ if file:
         # ---------- CHARTS ROW 1 ----------
         st.markdown("<div class='chart-title'>Revenue Distribution Across Segments</div>", unsafe_allow_html=True)
         
-        revenue_by_segment = filtered_df.groupby("Segment")["RevenueINR"].sum().reset_index()
-        revenue_by_segment = revenue_by_segment.sort_values('RevenueINR', ascending=False)
+        revenue_by_segment = aggregations['revenue_by_segment']
         
         fig1 = px.bar(
             revenue_by_segment, 
@@ -361,13 +446,15 @@ if file:
         
         with col_left:
             st.markdown("<div class='chart-title'>Battery Capacity vs Range</div>", unsafe_allow_html=True)
+            scatter_binned = 'scatter_data' in aggregations
             fig2 = px.scatter(
-                filtered_df, 
+                aggregations['scatter_data'] if scatter_binned else filtered_df, 
                 x="BatterykWh", 
                 y="Rangekm",
                 size="RevenueINR", 
                 color="Segment",
-                hover_data=["Manufacturer", "Model"],
+                hover_data=None if scatter_binned else ["Manufacturer", "Model"],
+                render_mode="webgl",
                 labels={"BatterykWh": "Battery (kWh)", "Rangekm": "Range (km)"},
                 color_discrete_sequence=["#ef4444", "#f59e0b", "#10b981", "#3b82f6", "#8b5cf6"]
             )
@@ -385,7 +472,7 @@ if file:
         
         with col_right:
             st.markdown("<div class='chart-title'>Profit by Manufacturer</div>", unsafe_allow_html=True)
-            top_manufacturers = filtered_df.groupby("Manufacturer")["ProfitINR"].sum().sort_values(ascending=False).head(10).reset_index()
+            top_manufacturers = aggregations['top_manufacturers']
             
             fig3 = px.bar(
                 top_manufacturers, 
@@ -416,71 +503,64 @@ if file:
         # ---------- ADDITIONAL INSIGHTS ----------
         st.markdown("<br>", unsafe_allow_html=True)
         
-        col_metrics1, col_metrics2, col_metrics3 = st.columns(3)
-        
-        with col_metrics1:
-            st.markdown("<div class='chart-title'>Usage Type Distribution</div>", unsafe_allow_html=True)
-            if 'UsageType' in filtered_df.columns:
-                usage_data = filtered_df.groupby('UsageType').size().reset_index(name='Count')
-                fig4 = px.pie(
-                    usage_data,
-                    values='Count',
-                    names='UsageType',
-                    color_discrete_sequence=["#ef4444", "#f59e0b", "#10b981", "#3b82f6"]
-                )
-                fig4.update_layout(
-                    plot_bgcolor='#0f1419',
-                    paper_bgcolor='#0f1419',
-                    font=dict(color='#e5e7eb'),
-                    showlegend=True,
-                    height=300,
-                    margin=dict(t=20, l=0, r=0, b=0)
-                )
-                st.plotly_chart(fig4, use_container_width=True)
-        
-        with col_metrics2:
-            st.markdown("<div class='chart-title'>Average Charging Time</div>", unsafe_allow_html=True)
-            if 'ChargingTimeHours' in filtered_df.columns:
-                charging_by_segment = filtered_df.groupby('Segment')['ChargingTimeHours'].mean().reset_index()
-                fig5 = px.bar(
-                    charging_by_segment,
-                    x='Segment',
-                    y='ChargingTimeHours',
-                    color='Segment',
-                    labels={'ChargingTimeHours': 'Hours'},
-                    color_discrete_sequence=["#ef4444", "#f59e0b", "#10b981", "#3b82f6"]
-                )
-                fig5.update_layout(
-                    plot_bgcolor='#0f1419',
-                    paper_bgcolor='#0f1419',
-                    font=dict(color='#e5e7eb'),
-                    showlegend=False,
-                    height=300,
-                    margin=dict(t=20, l=0, r=0, b=0)
-                )
-                st.plotly_chart(fig5, use_container_width=True)
-        
-        with col_metrics3:
-            st.markdown("<div class='chart-title'>Energy Consumption</div>", unsafe_allow_html=True)
-            if 'EnergykWh' in filtered_df.columns:
-                energy_by_segment = filtered_df.groupby('Segment')['EnergykWh'].mean().reset_index()
-                fig6 = px.bar(
-                    energy_by_segment,
-                    x='Segment',
-                    y='EnergykWh',
-                    color='Segment',
-                    labels={'EnergykWh': 'kWh'},
-                    color_discrete_sequence=["#ef4444", "#f59e0b", "#10b981", "#3b82f6"]
-                )
-                fig6.update_layout(
-                    plot_bgcolor='#0f1419',
-                    paper_bgcolor='#0f1419',
-                    font=dict(color='#e5e7eb'),
-                    showlegend=False,
-                    height=300,
-                    margin=dict(t=20, l=0, r=0, b=0)
+        # Combine the insight charts into one multi-panel figure, serialized once
+        insight_palette = ["#ef4444", "#f59e0b", "#10b981", "#3b82f6"]
+        insight_panels = []
+        if 'usage_data' in aggregations:
+            insight_panels.append(('Usage Type Distribution', 'pie'))
+        if 'charging_by_segment' in aggregations:
+            insight_panels.append(('Average Charging Time', 'bar'))
+        if 'energy_by_segment' in aggregations:
+            insight_panels.append(('Energy Consumption', 'bar'))
+
+        if insight_panels:
+            fig_insights = make_subplots(
+                rows=1,
+                cols=len(insight_panels),
+                specs=[[{"type": panel_type} for _, panel_type in insight_panels]],
+                subplot_titles=[title for title, _ in insight_panels]
+            )
+            panel_col = 1
+
+            if 'usage_data' in aggregations:
+                usage_data = aggregations['usage_data']
+                fig_insights.add_trace(
+                    go.Pie(
+                        labels=usage_data['UsageType'].tolist(),
+                        values=usage_data['Count'].tolist(),
+                        marker=dict(colors=insight_palette)
+                    ),
+                    row=1, col=panel_col
                 )
-                st.plotly_chart(fig6, use_container_width=True)
+                panel_col += 1
+
+            for key, metric, axis_title in [
+                ('charging_by_segment', 'ChargingTimeHours', 'Hours'),
+                ('energy_by_segment', 'EnergykWh', 'kWh'),
+            ]:
+                if key in aggregations:
+                    segment_data = aggregations[key]
+                    fig_insights.add_trace(
+                        go.Bar(
+                            x=segment_data['Segment'].tolist(),
+                            y=segment_data[metric].tolist(),
+                            marker_color=[insight_palette[i % len(insight_palette)] for i in range(len(segment_data))],
+                            showlegend=False
+                        ),
+                        row=1, col=panel_col
+                    )
+                    fig_insights.update_yaxes(title_text=axis_title, row=1, col=panel_col)
+                    panel_col += 1
+
+            fig_insights.update_layout(
+                plot_bgcolor='#0f1419',
+                paper_bgcolor='#0f1419',
+                font=dict(color='#e5e7eb'),
+                showlegend=True,
+                height=300,
+                margin=dict(t=40, l=0, r=0, b=0)
+            )
+            st.plotly_chart(fig_insights, use_container_width=True)
 
         # ---------- RAW DATA ----------
         st.markdown("<br>", unsafe_allow_html=True)
@@ -496,7 +576,7 @@ if file:
         col_download1, col_download2 = st.columns(2)
         
         with col_download1:
-            csv = filtered_df.to_csv(index=False).encode('utf-8')
+            csv = filtered_csv(data_key, tuple(segment_filter), tuple(manufacturer_filter), filtered_df)
             st.download_button(
                 label="📥 Download Filtered Data as CSV",
                 data=csv,
@@ -510,10 +590,10 @@ if file:
                 'Metric': ['Total Vehicles', 'Total Revenue (₹)', 'Total Profit (₹)', 'Avg Battery (kWh)', 'Avg Range (km)'],
                 'Value': [
                     len(filtered_df),
-                    f"₹{filtered_df['RevenueINR'].sum():,.0f}",
-                    f"₹{filtered_df['ProfitINR'].sum():,.0f}",
-                    f"{filtered_df['BatterykWh'].mean():.1f}",
-                    f"{filtered_df['Rangekm'].mean():.1f}"
+                    f"₹{stats['RevenueINR']:,.0f}",
+                    f"₹{stats['ProfitINR']:,.0f}",
+                    f"{stats['BatterykWh']:.1f}",
+                    f"{stats['Rangekm']:.1f}"
                 ]
             })
             summary_csv = summary.to_csv(index=False).encode('utf-8')